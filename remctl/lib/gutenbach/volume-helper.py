@@ -10,6 +10,12 @@ j = os.path.join
 
 arg = sys.argv[1]
 currentDir = os.path.split(__file__)[0]
+
+def getConfig(key):
+	return Popen(['/usr/lib/gutenbach/gutenbach-get-config', key], stdout=PIPE).communicate()[0]
+
+mixer = getConfig('mixer')
+card = getConfig('card')
 #sys.path[:0] = [currentDir]
 
 def getVolume():
@@ -29,7 +35,7 @@ def setVolume(percent):
 	for i in range(10+1):
 		frac = i/10
 		tempV = int(v + (newV-v)*frac)
-		command = ['amixer', 'set', 'PCM', str(tempV)]
+		command = ['amixer'] + (card and ['-c', card] or []) + ['set', mixer, str(tempV)]
 		#print tempV
 		sys.stdout.flush()
 		call(command, stdout=PIPE)
@@ -0,0 +1,192 @@
+# Album art cache for gutenbach
+#
+# This file is meant to be pulled in with
+#   require "/usr/lib/gutenbach/gutenbach-art.pl";
+# by anything that already has the ExifTool information for a job
+# (the spool filter and the queue display; the web queue only reads
+# the cache, with cached_job_album_art).  Cover art
+# is pulled out of that information once, shrunk to each of
+# @art_sizes and kept under $art_cache_dir in a directory named after
+# the SHA-1 of the original image, so the same album cover is only
+# ever stored once.  Jobs are mapped to their art with small files in
+# $art_cache_dir/jobs.
+#
+# Note that ExifTool only hands back the actual picture data if it is
+# called with the Binary option, e.g.
+#   ImageInfo($filepath, {Binary => 1})
+# That means reading every embedded image, so callers should first
+# ask cached_job_album_art whether the job has been looked at already.
+#
+# The filter runs as lp and the queue display as whoever starts it, so
+# the install makes $art_cache_dir and its jobs directory group lp and
+# setgid, and everything here is written group-writable.
+
+use strict;
+use warnings;
+use Digest::SHA qw(sha1_hex);
+use Fcntl qw(:flock);
+use File::Temp qw(tempfile);
+
+use vars qw/$art_cache_dir $art_cache_max_bytes @art_sizes/;
+
+$art_cache_dir = "/var/cache/gutenbach/art" unless defined $art_cache_dir;
+# Least recently used art is thrown away once the cache passes this size
+$art_cache_max_bytes = 64*1024*1024 unless defined $art_cache_max_bytes;
+@art_sizes = (64, 128, 300) unless @art_sizes;
+
+# cached_job_album_art(JOBID)
+# If we have already looked for the art of a job, return a one element
+# list holding its cache key (or undef if it has no art).  Returns an
+# empty list if the job still needs to be looked at.
+sub cached_job_album_art {
+  my $jobid = shift(@_);
+
+  open(JOBART, "<", "$art_cache_dir/jobs/$jobid") or return ();
+  my $hash = <JOBART>;
+  close(JOBART);
+  $hash = "" unless defined $hash;
+  chomp $hash;
+  # An empty file means we already looked and there was no art
+  return (undef) if $hash eq "";
+  return () unless -d "$art_cache_dir/$hash";
+  # Mark it as recently used (this quietly does nothing for readers
+  # that can't write to the cache)
+  utime(undef, undef, "$art_cache_dir/$hash");
+  return ($hash);
+}
+
+# job_album_art(JOBID, FILEINFO)
+# Return the cache key of the art for a job, extracting it from
+# FILEINFO (as returned by ImageInfo with Binary set) the first time
+# we see the job.  Returns undef if the job has no art.
+sub job_album_art {
+  my ($jobid, $fileinfo) = @_;
+  my $jobfile = "$art_cache_dir/jobs/$jobid";
+
+  my @cached = cached_job_album_art($jobid);
+  return $cached[0] if @cached;
+
+  my $umask = umask(002);
+  my $hash = cache_album_art($fileinfo);
+  if (-d "$art_cache_dir/jobs" || mkdir("$art_cache_dir/jobs")) {
+    if (open(JOBART, ">", $jobfile)) {
+      print JOBART (defined $hash ? $hash : ""), "\n";
+      close(JOBART);
+    }
+  }
+  umask($umask);
+  return $hash;
+}
+
+# cache_album_art(FILEINFO)
+# Store the cover art found in FILEINFO in the cache, if it isn't
+# there already, and return its cache key (or undef if there is none).
+sub cache_album_art {
+  my $fileinfo = shift(@_);
+
+  my $data;
+  foreach my $tag (qw/Picture CoverArt PictureData/) {
+    if (ref($fileinfo->{$tag}) eq "SCALAR" && ${$fileinfo->{$tag}} !~ /^Binary data/) {
+      $data = ${$fileinfo->{$tag}};
+      last;
+    }
+  }
+  return undef unless $data;
+
+  # The picture comes from whatever somebody printed.  Only hand
+  # ImageMagick JPEG or PNG, and tell it which, so it never guesses
+  # its way into one of its scriptable formats (MVG, MSL, SVG...).
+  my $format;
+  if ($data =~ /^\xFF\xD8\xFF/) {
+    $format = "jpeg";
+  } elsif ($data =~ /^\x89PNG\r\n\x1A\n/) {
+    $format = "png";
+  } else {
+    return undef;
+  }
+
+  my $hash = sha1_hex($data);
+  my $dir = "$art_cache_dir/$hash";
+  if (-d $dir) {
+    # Mark it as recently used
+    utime(undef, undef, $dir);
+    return $hash;
+  }
+
+  mkdir($art_cache_dir) unless -d $art_cache_dir;
+  open(my $lock, ">", "$art_cache_dir/.lock") or return undef;
+  flock($lock, LOCK_EX);
+
+  unless (-d $dir) {
+    my ($fh, $original) = tempfile("gutenbach-artXXXXX", TMPDIR => 1, UNLINK => 1);
+    print $fh $data;
+    close($fh);
+
+    # Build the thumbnails next to the final directory and move them
+    # into place at once, so nobody sees a half-written entry
+    my $building = "$dir.tmp";
+    mkdir($building);
+    my $ok = 1;
+    foreach my $size (@art_sizes) {
+      if (system("convert", "$format:$original\[0]", "-thumbnail", "${size}x${size}",
+		 "-strip", "$building/$size.jpg") != 0) {
+	$ok = 0;
+	last;
+      }
+    }
+    unlink($original);
+
+    if ($ok) {
+      rename($building, $dir);
+      evict_album_art();
+    } else {
+      unlink(glob("$building/*"));
+      rmdir($building);
+      $hash = undef;
+    }
+  }
+
+  close($lock);
+  return $hash;
+}
+
+# evict_album_art()
+# Remove the least recently used art until the cache fits in
+# $art_cache_max_bytes, along with job entries that point at evicted
+# art or are over a week old.  Called with the cache lock held.
+sub evict_album_art {
+  my (%size, %used);
+  my $total = 0;
+  foreach my $dir (glob("$art_cache_dir/*")) {
+    next unless $dir =~ m|/([0-9a-f]{40})$| && -d $dir;
+    my $hash = $1;
+    $used{$hash} = (stat($dir))[9];
+    $size{$hash} = 0;
+    $size{$hash} += -s $_ foreach glob("$dir/*");
+    $total += $size{$hash};
+  }
+
+  my %evicted;
+  foreach my $hash (sort { $used{$a} <=> $used{$b} } keys %used) {
+    last if $total <= $art_cache_max_bytes;
+    unlink(glob("$art_cache_dir/$hash/*"));
+    rmdir("$art_cache_dir/$hash");
+    $total -= $size{$hash};
+    $evicted{$hash} = 1;
+  }
+
+  foreach my $jobfile (glob("$art_cache_dir/jobs/*")) {
+    if (-M $jobfile > 7) {
+      unlink($jobfile);
+      next;
+    }
+    next unless %evicted;
+    open(JOBART, "<", $jobfile) or next;
+    my $hash = <JOBART>;
+    close(JOBART);
+    chomp $hash if defined $hash;
+    unlink($jobfile) if $hash && $evicted{$hash};
+  }
+}
+
+1;
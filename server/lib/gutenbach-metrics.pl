@@ -0,0 +1,129 @@
+# Timing spans and log housekeeping for gutenbach
+#
+# This file is meant to be pulled in with
+#   require "/usr/lib/gutenbach/gutenbach-metrics.pl";
+# by the spool filter and the remctl/queue helpers.  Every finished
+# span is folded into a Prometheus-style histogram stored in
+# $metrics_file, which can be picked up by node_exporter's textfile
+# collector (or just cat'ed by a human).
+#
+# The filter runs as lp and the remctl commands as root, so each user
+# keeps its own file (metrics-lp.prom, metrics-root.prom, ...) rather
+# than fighting over the ownership of a shared one.
+
+use strict;
+use warnings;
+use Fcntl qw(:flock);
+use Time::HiRes qw(time);
+
+use vars qw/$metrics_file @metrics_buckets %metrics_labels $log_max_bytes $log_max_lines/;
+
+my $metrics_user = getpwuid($>) || $>;
+$metrics_file = "/var/run/gutenbach/metrics-$metrics_user.prom" unless defined $metrics_file;
+@metrics_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600, 1800)
+    unless @metrics_buckets;
+# Logs are rotated (one old generation is kept) once they pass this size
+$log_max_bytes = 1024*1024 unless defined $log_max_bytes;
+# At most this many lines are written per process through log_line()
+$log_max_lines = 200 unless defined $log_max_lines;
+
+my %span_start;
+my $log_lines = 0;
+
+# span_start(NAME)
+# Mark the beginning of a timing span.
+sub span_start {
+  my $name = shift(@_);
+  $span_start{$name} = time();
+}
+
+# span_end(NAME, [LABELS])
+# Finish a timing span started with span_start and record it.
+# Returns the elapsed time in seconds.
+sub span_end {
+  my ($name, $labels) = @_;
+  return unless exists $span_start{$name};
+  my $elapsed = time() - delete $span_start{$name};
+  metrics_observe($name, $elapsed, $labels);
+  return $elapsed;
+}
+
+# metrics_observe(NAME, SECONDS, [LABELS])
+# Add one observation to the histogram for NAME.  LABELS is an
+# optional hash reference of extra labels, which are added to the ones
+# in %metrics_labels (e.g. the zone).
+sub metrics_observe {
+  my ($name, $elapsed, $labels) = @_;
+  my %labels = (%metrics_labels, span => $name, %{$labels || {}});
+  my $labelstr = join(",", map { "$_=\"$labels{$_}\"" } sort keys %labels);
+
+  my $lock;
+  open($lock, ">>", "$metrics_file.lock") or return;
+  flock($lock, LOCK_EX) or return;
+
+  # The file itself is the state: read back every series, add this
+  # observation and write the whole thing out again.
+  my %series;
+  my $fh;
+  open($fh, "<", $metrics_file) or $fh = undef;
+  while ($fh && defined($_ = <$fh>)) {
+    if (/^gutenbach_span_seconds_bucket\{(.*),le="([^"]+)"\} (\S+)$/) {
+      $series{$1}{buckets}{$2} = $3;
+    } elsif (/^gutenbach_span_seconds_(sum|count)\{(.*)\} (\S+)$/) {
+      $series{$2}{$1} = $3;
+    }
+  }
+
+  my $s = $series{$labelstr} ||= {buckets => {}, sum => 0, count => 0};
+  foreach my $le (@metrics_buckets, "+Inf") {
+    $s->{buckets}{$le} ||= 0;
+    $s->{buckets}{$le}++ if $le eq "+Inf" || $elapsed <= $le;
+  }
+  $s->{sum} += $elapsed;
+  $s->{count}++;
+  close($fh) if $fh;
+
+  # Write a new file and rename it into place, so the textfile
+  # collector never sees half of one
+  open($fh, ">", "$metrics_file.tmp") or return;
+  print $fh "# HELP gutenbach_span_seconds Time spent in each stage of gutenbach.\n";
+  print $fh "# TYPE gutenbach_span_seconds histogram\n";
+  foreach my $key (sort keys %series) {
+    my $buckets = $series{$key}{buckets};
+    foreach my $le (sort { ($a eq "+Inf") <=> ($b eq "+Inf") || $a <=> $b } keys %$buckets) {
+      print $fh "gutenbach_span_seconds_bucket{$key,le=\"$le\"} $buckets->{$le}\n";
+    }
+    print $fh "gutenbach_span_seconds_sum{$key} $series{$key}{sum}\n";
+    print $fh "gutenbach_span_seconds_count{$key} $series{$key}{count}\n";
+  }
+  close($fh) or return;
+  chmod(0644, "$metrics_file.tmp");
+  rename("$metrics_file.tmp", $metrics_file);
+  close($lock);
+}
+
+# rotate_log(PATH)
+# If PATH has grown past $log_max_bytes, move it to PATH.1 (clobbering
+# whatever was there) so that logs in /tmp don't grow without bound.
+sub rotate_log {
+  my $path = shift(@_);
+  if (-f $path && -s $path > $log_max_bytes) {
+    rename($path, "$path.1");
+  }
+}
+
+# log_line(FH, FORMAT, ARGS...)
+# printf to FH, but stop after $log_max_lines lines so a misbehaving
+# job can't flood the log.
+sub log_line {
+  my ($fh, $format, @args) = @_;
+  $log_lines++;
+  return if $log_lines > $log_max_lines + 1;
+  if ($log_lines > $log_max_lines) {
+    print $fh "Log limit of $log_max_lines lines reached, suppressing further output\n";
+    return;
+  }
+  printf($fh $format, @args);
+}
+
+1;
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the splicing and crossfading done by gutenbach-mix"""
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import imp
+
+import numpy
+from nose.tools import eq_
+
+mix = imp.load_source('gutenbach_mix',
+                      os.path.join(os.path.dirname(__file__), 'gutenbach-mix'))
+
+
+def track(frames, start=0):
+    """A recognizable track: every sample is its frame number (mod 2^15)"""
+    samples = (numpy.arange(start, start + frames) % 32768).astype('<i2')
+    return numpy.repeat(samples[:, numpy.newaxis], mix.CHANNELS, axis=1)
+
+def pipe(frames):
+    return io.BytesIO(frames.tobytes())
+
+class ListSink(object):
+    """Keeps everything written to it"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, frames):
+        self.chunks.append(frames)
+
+    def close(self):
+        pass
+
+    @property
+    def frames(self):
+        if not self.chunks:
+            return numpy.zeros((0, mix.CHANNELS), dtype='<i2')
+        return numpy.concatenate(self.chunks)
+
+class TestCrossfade(object):
+    """Test case for crossfade()."""
+
+    def test_ends(self):
+        """The fade starts on the old track and ends on the new one"""
+        tail = numpy.full((1000, 2), 10000, dtype='<i2')
+        head = numpy.full((1000, 2), -10000, dtype='<i2')
+        mixed = mix.crossfade(tail, head)
+        eq_(mixed.shape, (1000, 2))
+        eq_(mixed.dtype, numpy.dtype('<i2'))
+        assert mixed[0][0] > 9900
+        assert mixed[-1][0] < -9900
+
+    def test_equal_power(self):
+        """Equal-power fades raise correlated signals by 3 dB halfway through"""
+        tail = numpy.full((1000, 2), 10000, dtype='<i2')
+        mixed = mix.crossfade(tail, tail).astype(float)
+        # cos + sin peaks at sqrt(2) halfway through
+        assert abs(mixed[500][0] - 10000 * numpy.sqrt(2)) < 20
+        assert mixed.min() >= 10000 - 1
+
+    def test_clipping(self):
+        """Loud tracks are clipped rather than wrapping around"""
+        loud = numpy.full((100, 2), 32767, dtype='<i2')
+        mixed = mix.crossfade(loud, loud)
+        eq_(mixed.max(), 32767)
+        assert mixed.min() > 0
+
+class TestPlay(object):
+    """Test case for skip_frames() and play()."""
+
+    def test_hold_back_window(self):
+        """Everything but the last window frames is written"""
+        sink = ListSink()
+        written, held = mix.play(pipe(track(10000)), sink, 3000)
+        eq_(written, 7000)
+        eq_(len(sink.frames), 7000)
+        eq_(len(held), 3000)
+        eq_(numpy.concatenate((sink.frames, held)).tolist(), track(10000).tolist())
+
+    def test_short_track(self):
+        """A track shorter than the window is held back entirely"""
+        sink = ListSink()
+        written, held = mix.play(pipe(track(100)), sink, 3000)
+        eq_(written, 0)
+        eq_(len(held), 100)
+
+    def test_no_window(self):
+        """With no crossfade nothing is held back"""
+        sink = ListSink()
+        written, held = mix.play(pipe(track(10000)), sink, 0)
+        eq_(written, 10000)
+        eq_(len(held), 0)
+
+    def test_skip(self):
+        """Skipped frames are never written"""
+        source = pipe(track(10000))
+        eq_(mix.skip_frames(source, 2500), 2500)
+        sink = ListSink()
+        written, held = mix.play(source, sink, 0)
+        eq_(written, 7500)
+        eq_(sink.frames.tolist(), track(7500, 2500).tolist())
+
+    def test_skip_past_end(self):
+        """Skipping more than the whole track just empties it"""
+        source = pipe(track(100))
+        eq_(mix.skip_frames(source, 2500), 100)
+        eq_(mix.play(source, ListSink(), 0)[0], 0)
+
+class TestHandoff(object):
+    """Test case for splice() and the handoff between jobs."""
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        self.handoff = os.path.join(self.dir, 'handoff')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_read_write(self):
+        """The next job gets the frame count and time"""
+        mix.write_handoff(self.handoff, 12, 3456, 1000.5)
+        eq_(mix.read_handoff(self.handoff, 12), (3456, 1000.5))
+        assert not os.path.exists(self.handoff)
+
+    def test_wrong_job(self):
+        """Any other job starts from the beginning"""
+        mix.write_handoff(self.handoff, 12, 3456, 1000.5)
+        eq_(mix.read_handoff(self.handoff, 13), (0, None))
+        assert not os.path.exists(self.handoff)
+
+    def test_no_handoff(self):
+        eq_(mix.read_handoff(self.handoff, 12), (0, None))
+
+    def test_splice(self):
+        """The end of one job is mixed with the opening of the next"""
+        held = track(3000)
+        head = track(8000, 20000)
+        body, opening, mixed = mix.splice(held, head)
+        eq_(mixed, 3000)
+        eq_(len(body), 3000)
+        eq_(opening.tolist(), head[3000:].tolist())
+
+    def test_splice_short_head(self):
+        """A next job shorter than the crossfade is mixed in whole"""
+        held = track(3000)
+        body, opening, mixed = mix.splice(held, track(1000))
+        eq_(mixed, 1000)
+        eq_(len(body), 3000)
+        eq_(len(opening), 0)
+
+    def check_jobs(self, window, lead):
+        """Play two jobs as gutenbach-mix would and check what came out"""
+        first, second = track(50000), track(40000, 1000)
+        sink = ListSink()
+
+        # The first job, which splices itself into the second
+        written, held = mix.play(pipe(first), sink, window)
+        head = mix.read_frames(pipe(second), window + lead)
+        held, opening, mixed = mix.splice(held, head)
+        sink.write(held)
+        sink.write(opening)
+        mix.write_handoff(self.handoff, 2, mixed + len(opening), 1000.0)
+
+        # The second job, which skips what was already played
+        source = pipe(second)
+        skip, previous = mix.read_handoff(self.handoff, 2)
+        eq_(mix.skip_frames(source, skip), window + lead)
+        mix.play(source, sink, 0)
+
+        out = sink.frames
+        eq_(len(out), len(first) + len(second) - window)
+        eq_(out[:len(first) - window].tolist(), first[:len(first) - window].tolist())
+        eq_(out[len(first):].tolist(), second[window:].tolist())
+
+    def test_gapless(self):
+        """With no crossfade the jobs are simply butted together"""
+        self.check_jobs(0, 5000)
+
+    def test_crossfaded(self):
+        """With a crossfade the overlap is only played once"""
+        self.check_jobs(3000, 5000)
+
+    def test_no_lead(self):
+        self.check_jobs(3000, 0)
+
+    def lead(self, job):
+        """A stand-in for the lead process of job"""
+        proc = subprocess.Popen(['sleep', '60'])
+        out = open(self.handoff + '.lead.pid', 'w')
+        out.write('%d %d\n' % (proc.pid, job))
+        out.close()
+        return proc
+
+    def test_stop_lead(self):
+        """The lead of a canceled job is stopped by the next one"""
+        proc = self.lead(12)
+        mix.stop_lead(self.handoff + '.lead.pid', 13)
+        eq_(proc.wait(), -15)
+        assert not os.path.exists(self.handoff + '.lead.pid')
+
+    def test_keep_lead(self):
+        """The lead of the job itself is left to finish"""
+        proc = self.lead(12)
+        mix.stop_lead(self.handoff + '.lead.pid', 12)
+        eq_(proc.poll(), None)
+        proc.kill()
+        proc.wait()
+        mix.remove_lead_pidfile(self.handoff + '.lead.pid', proc.pid)
+        assert not os.path.exists(self.handoff + '.lead.pid')
+
+class TestDecoderPool(object):
+    """Test case for the shared decoder slots and decoded tracks."""
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        self.slots = os.path.join(self.dir, 'decoders')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_one_slot_each(self):
+        """Each decoder gets a slot of its own"""
+        first = mix.acquire_slot(2, self.slots)
+        second = mix.acquire_slot(2, self.slots)
+        assert first.name != second.name
+        first.close()
+        third = mix.acquire_slot(2, self.slots)
+        eq_(third.name, first.name)
+        second.close()
+        third.close()
+
+    def test_no_slots(self):
+        """If the slots can't be made, decoding goes ahead anyway"""
+        eq_(mix.acquire_slot(2, '/proc/no-such-dir/decoders'), None)
+
+    def test_decoded_track(self):
+        """A finished track is read to its end"""
+        out = os.path.join(self.dir, '1.raw')
+        track(1000).tofile(out)
+        decoded = mix.DecodedTrack(out)
+        eq_(mix.read_frames(decoded, 600).tolist(), track(600).tolist())
+        eq_(len(mix.read_frames(decoded, 600)), 400)
+        eq_(len(mix.read_frames(decoded, 600)), 0)
+        decoded.close()
+
+    def test_missing_track(self):
+        """With no file and no decoder there is nothing to play"""
+        decoded = mix.DecodedTrack(os.path.join(self.dir, '2.raw'))
+        eq_(len(mix.read_frames(decoded, 600)), 0)
+
+    def test_start_decoder(self):
+        """Tracks are decoded in the background and read as they grow"""
+        source = os.path.join(self.dir, 'source')
+        track(50000).tofile(source)
+        out = os.path.join(self.dir, '3.raw')
+        def command(path, part):
+            return ['sh', '-c', 'sleep 0.3; cat "$0" > "$1"', path, part]
+        pid = mix.start_decoder(source, out, 1, command, self.slots)
+        eq_(int(open(out + '.pid').read()), pid)
+        assert mix.decoder_running(out)
+        decoded = mix.DecodedTrack(out)
+        written, held = mix.play(decoded, ListSink(), 0)
+        eq_(written, 50000)
+        assert os.path.exists(out)
+        assert not os.path.exists(out + '.part')
+        mix.remove_decoded(out)
+        eq_(sorted(os.listdir(self.dir)), ['decoders', 'source'])
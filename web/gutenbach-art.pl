@@ -0,0 +1,46 @@
+#!/usr/bin/perl
+# Serve album art thumbnails out of the gutenbach art cache
+#
+# gutenbach-art.pl?art=HASH&size=SIZE
+#
+# The cache is keyed on a hash of the image, so a given URL always
+# returns the same bytes: let browsers and proxies keep it forever.
+
+use CGI ':standard';
+
+use strict;
+use warnings;
+
+require "/usr/lib/gutenbach/gutenbach-art.pl" or die "Unable to load album art cache";
+
+use vars qw/$art_cache_dir @art_sizes/;
+
+my $art = param('art') || "";
+my $size = param('size') || $art_sizes[0];
+
+my $path = "$art_cache_dir/$art/$size.jpg";
+if ($art !~ /^[0-9a-f]{40}$/ || !(grep { $_ eq $size } @art_sizes) || !-r $path) {
+    print header(-status => '404 Not Found', -type => 'text/plain');
+    print "No such album art\n";
+    exit 0;
+}
+
+my $etag = "\"$art-$size\"";
+my $cache_control = "public, max-age=31536000, immutable";
+
+my $if_none_match = $ENV{'HTTP_IF_NONE_MATCH'} || "";
+if (grep { $_ eq $etag || $_ eq "*" } split(/\s*,\s*/, $if_none_match)) {
+    print header(-status => '304 Not Modified', -ETag => $etag, -Cache_Control => $cache_control);
+    exit 0;
+}
+
+open(ART, "<", $path) or die "Couldn't open $path: $!";
+binmode(ART);
+binmode(STDOUT);
+print header(-type => 'image/jpeg', -ETag => $etag, -Cache_Control => $cache_control,
+	     -Content_Length => -s $path);
+my $buf;
+while (read(ART, $buf, 64*1024)) {
+    print $buf;
+}
+close(ART);
@@ -3,6 +3,8 @@ use Net::CUPS::Destination;
 use Image::ExifTool qw(ImageInfo);
 use CGI ':standard';
 
+require "/usr/lib/gutenbach/gutenbach-art.pl" or die "Unable to load album art cache";
+
 use strict;
 use warnings;
 
@@ -18,7 +20,7 @@ my $attr;
 print  <<EOF;
 <TABLE SUMMARY="Job List"> 
 <THEAD> 
-<TR><TH> USER</TH><TH>TITLE</TH><TH>ARTIST</TH><TH>ALBUM</TH></TR> 
+<TR><TH></TH><TH> USER</TH><TH>TITLE</TH><TH>ARTIST</TH><TH>ALBUM</TH></TR> 
 </THEAD>
 <TBODY>  
 EOF
@@ -31,6 +33,14 @@ foreach $jobid(@jobs)
 	my $magic = $fileinfo->{FileType};
 	#print"$job_ref->{ 'user' } is playing:\n";
 	print "<TR VALIGN=\"TOP\">";
+	# We run as the web server, so only look in the cache; the filter
+	# and the queue display are the ones that fill it
+	my ($art) = cached_job_album_art($job_ref->{ 'id' });
+	if ($art) {
+	    print "<TD><IMG SRC=\"gutenbach-art.pl?art=$art&amp;size=64\" WIDTH=\"64\" HEIGHT=\"64\" ALT=\"\"></TD>\n";
+	} else {
+	    print "<TD></TD>\n";
+	}
 	print "<TD>$job_ref->{ 'user'}</TD>\n";
 	if($magic)
 	{
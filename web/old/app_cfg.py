@@ -1,9 +1,46 @@
 from tg.configuration import AppConfig, Bunch
+from repoze.what.plugins.sql.adapters import SqlGroupsAdapter, \
+                                             SqlPermissionsAdapter
 import sipbmp3web
 from sipbmp3web import model
+from sipbmp3web.model.auth import cached_groups, cached_permissions
 from sipbmp3web.lib import app_globals, helpers
 
-base_config = AppConfig()
+class CachedGroupsAdapter(SqlGroupsAdapter):
+    """Finds the user's groups in the model's permission cache."""
+    def _find_sections(self, credentials):
+        return set(cached_groups(credentials['repoze.what.userid']))
+
+class CachedPermissionsAdapter(SqlPermissionsAdapter):
+    """Finds the group's permissions in the model's permission cache."""
+    def _find_sections(self, group_name):
+        return set(cached_permissions(group_name))
+
+class GutenbachAppConfig(AppConfig):
+    """The stock sqlalchemy auth backend, but authorized from the cache
+
+    repoze.what's SQL adapters load the user, its groups and every
+    group's permissions on every request, and never look at
+    User.permissions.  Its groups and permissions adapters are swapped
+    for ones backed by the cache in sipbmp3web.model.auth; they keep
+    the stock adapters' methods for editing groups and permissions.
+    """
+    def add_auth_middleware(self, app, skip_authentication):
+        # The quickstart adds its metadata providers, repoze.what's
+        # authorization one included, to this list
+        self.sa_auth.mdproviders = mdproviders = []
+        app = AppConfig.add_auth_middleware(self, app, skip_authentication)
+        sa_auth = self.sa_auth
+        for name, provider in mdproviders:
+            if name == 'authorization_md':
+                provider.group_adapters = {'sql_auth': CachedGroupsAdapter(
+                    sa_auth.group_class, sa_auth.user_class, sa_auth.dbsession)}
+                provider.permission_adapters = {'sql_auth': CachedPermissionsAdapter(
+                    sa_auth.permission_class, sa_auth.group_class, sa_auth.dbsession)}
+        del self.sa_auth['mdproviders']
+        return app
+
+base_config = GutenbachAppConfig()
 base_config.renderers = []
 
 base_config.package = sipbmp3web
@@ -21,7 +58,8 @@ base_config.use_sqlalchemy = True
 base_config.model = sipbmp3web.model
 base_config.DBSession = sipbmp3web.model.DBSession
 
-# Configure the authentication backend
+# Configure the authentication backend; GutenbachAppConfig authorizes
+# from the cached permissions
 base_config.auth_backend = 'sqlalchemy'
 base_config.sa_auth.dbsession = model.DBSession
 # what is the class you want to use to search for users in the database
@@ -4,12 +4,14 @@ try:
 except ImportError:
     sys.exit('ImportError: no module named hashlib\nIf you are on python2.4 this library is not part of python. Please install it. Example: easy_install hashlib')
 import os
+import time
 from datetime import datetime
 
 from sqlalchemy import Table, ForeignKey, Column
 from sqlalchemy.types import String, Unicode, UnicodeText, Integer, DateTime, \
                              Boolean, Float
 from sqlalchemy.orm import relation, backref, synonym
+from sqlalchemy.orm.interfaces import AttributeExtension
 
 from sipbmp3web.model import DeclarativeBase, metadata, DBSession
 
@@ -32,6 +34,61 @@ user_group_table = Table('tg_user_group', metadata,
         onupdate="CASCADE", ondelete="CASCADE"))
 )
 
+# The names of each user's groups, keyed by user_name (which is what
+# repoze.who identifies users by), and the names of each group's
+# permissions, keyed by group_name, are cached here as (expiry time,
+# names).  Names rather than rows, so that they outlive the session
+# they were loaded in.  Changing a group's members or permissions
+# empties the caches; the expiry time covers changes made by other
+# processes.
+PERMISSION_CACHE_TIME = 60
+_group_cache = {}
+_permission_cache = {}
+
+def cached_groups(user_name):
+    """Return the names of a user's groups."""
+    cached = _group_cache.get(user_name)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    user = User.by_user_name(user_name)
+    names = frozenset()
+    if user is not None:
+        names = frozenset([g.group_name for g in user.groups])
+    _group_cache[user_name] = (time.time() + PERMISSION_CACHE_TIME, names)
+    return names
+
+def cached_permissions(group_name):
+    """Return the names of a group's permissions."""
+    cached = _permission_cache.get(group_name)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    group = DBSession.query(Group).filter(Group.group_name==group_name).first()
+    names = frozenset()
+    if group is not None:
+        names = frozenset([p.permission_name for p in group.permissions])
+    _permission_cache[group_name] = (time.time() + PERMISSION_CACHE_TIME, names)
+    return names
+
+def clear_permission_cache():
+    _group_cache.clear()
+    _permission_cache.clear()
+
+class PermissionCacheExtension(AttributeExtension):
+    """Forget the cached permissions when group membership or group
+    permissions change.
+    """
+
+    def append(self, state, value, initiator):
+        clear_permission_cache()
+        return value
+
+    def remove(self, state, value, initiator):
+        clear_permission_cache()
+
+    def set(self, state, value, oldvalue, initiator):
+        clear_permission_cache()
+        return value
+
 # auth model
 
 class Group(DeclarativeBase):
@@ -43,7 +100,10 @@ class Group(DeclarativeBase):
     group_name = Column(Unicode(16), unique=True, nullable=False)
     display_name = Column(Unicode(255))
     created = Column(DateTime, default=datetime.now)
-    users = relation('User', secondary=user_group_table, backref='groups')
+    users = relation('User', secondary=user_group_table,
+                     extension=PermissionCacheExtension(),
+                     backref=backref('groups',
+                                     extension=PermissionCacheExtension()))
 
     def __repr__(self):
         return '<Group: name=%s>' % self.group_name
@@ -85,6 +145,17 @@ class User(DeclarativeBase):
             perms = perms | set(g.permissions)
         return perms
 
+    @property
+    def permission_names(self):
+        """The names of the user's permissions, from the cache."""
+        if self.user_id is None:
+            # Not saved yet, so the cache can't know about it
+            return set([p.permission_name for p in self.permissions])
+        names = set()
+        for group_name in cached_groups(self.user_name):
+            names.update(cached_permissions(group_name))
+        return names
+
     @classmethod
     def by_email_address(cls, email):
         """A class method that can be used to search users
@@ -155,7 +226,9 @@ class Permission(DeclarativeBase):
     permission_name = Column(Unicode(16), unique=True, nullable=False)
     description = Column(Unicode(255))
     groups = relation(Group, secondary=group_permission_table,
-                      backref='permissions')
+                      extension=PermissionCacheExtension(),
+                      backref=backref('permissions',
+                                      extension=PermissionCacheExtension()))
 
     def __unicode__(self):
         return self.permission_name
@@ -0,0 +1,73 @@
+"""Timing histograms for the web controllers
+
+Each timed controller method is folded into a histogram kept in this
+process, and the whole lot can be rendered in the Prometheus text
+format from the /metrics controller.
+"""
+import time
+import threading
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram(object):
+    """A cumulative histogram of durations, in seconds."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, elapsed):
+        for i, le in enumerate(self.buckets):
+            if elapsed <= le:
+                self.counts[i] += 1
+        self.sum += elapsed
+        self.count += 1
+
+_lock = threading.Lock()
+_histograms = {}
+
+def observe(name, elapsed):
+    """Record that the span called name took elapsed seconds."""
+    _lock.acquire()
+    try:
+        if name not in _histograms:
+            _histograms[name] = Histogram()
+        _histograms[name].observe(elapsed)
+    finally:
+        _lock.release()
+
+def timed(name):
+    """Decorator that records how long each call of a function takes."""
+    def decorate(func):
+        def wrapper(*args, **kw):
+            start = time.time()
+            try:
+                return func(*args, **kw)
+            finally:
+                observe(name, time.time() - start)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__dict__.update(func.__dict__)
+        return wrapper
+    return decorate
+
+def render():
+    """Return every histogram in the Prometheus text format."""
+    lines = ["# HELP gutenbach_web_span_seconds Time spent in the web controllers.",
+             "# TYPE gutenbach_web_span_seconds histogram"]
+    _lock.acquire()
+    try:
+        for name in sorted(_histograms):
+            h = _histograms[name]
+            for le, count in zip(h.buckets, h.counts):
+                lines.append('gutenbach_web_span_seconds_bucket{span="%s",le="%s"} %d'
+                             % (name, le, count))
+            lines.append('gutenbach_web_span_seconds_bucket{span="%s",le="+Inf"} %d'
+                         % (name, h.count))
+            lines.append('gutenbach_web_span_seconds_sum{span="%s"} %f' % (name, h.sum))
+            lines.append('gutenbach_web_span_seconds_count{span="%s"} %d' % (name, h.count))
+    finally:
+        _lock.release()
+    return "\n".join(lines) + "\n"
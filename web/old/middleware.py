@@ -1,8 +1,9 @@
 """TurboGears middleware initialization"""
 from sipbmp3web.config.app_cfg import base_config
 from sipbmp3web.config.environment import load_environment
-import subprocess, os
-from pylons import config
+import subprocess, os, time
+from paste.deploy.converters import aslist
+from sipbmp3web.lib import metrics
 
 #Use base_config to setup the necessary WSGI App factory. 
 #make_base_app will wrap the TG2 app with all the middleware it needs. 
@@ -10,7 +11,7 @@ make_base_app = base_config.setup_tg_wsgi_app(load_environment)
 
 class FastCGIFixMiddleware(object):
     """Remove dispatch.fcgi from the SCRIPT_NAME
-    
+
     mod_rewrite doesn't do a perfect job of hiding it's actions to the
     underlying script, which causes TurboGears to get confused and tack
     on dispatch.fcgi when it really shouldn't. This fixes that problem as a
@@ -24,26 +25,69 @@ class FastCGIFixMiddleware(object):
         return self.app(environ, start_response)
 
 class KinitMiddleware(object):
-    """Performs Kerberos authentication with a keytab"""
-    def __init__(self, app, global_conf=None):
+    """Performs Kerberos authentication with a keytab
+
+    Tickets are only renewed every kinit_interval seconds (an hour by
+    default) rather than on every request, once kinit has succeeded.
+    """
+    def __init__(self, app, global_conf=None, app_conf=None):
         self.app = app
+        conf = dict(global_conf or {})
+        conf.update(app_conf or {})
         try:
-            self.keytab = config["keytab"]
-            self.krbname = config["krbname"]
+            self.keytab = conf["keytab"]
+            self.krbname = conf["krbname"]
         except KeyError:
             self.keytab = None
+        self.interval = int(conf.get("kinit_interval", 3600))
+        self.last_kinit = 0
     def __call__(self, environ, start_response):
-        if self.keytab:
+        if self.keytab and time.time() - self.last_kinit > self.interval:
             try:
-                subprocess.call(["kinit", self.krbname, "-k", "-t", self.keytab])
+                status = subprocess.call(["kinit", self.krbname, "-k", "-t", self.keytab])
             except OSError:
-                subprocess.call(["/usr/kerberos/bin/kinit", self.krbname, "-k", "-t", self.keytab])
+                status = subprocess.call(["/usr/kerberos/bin/kinit", self.krbname, "-k", "-t", self.keytab])
+            # A failed kinit is tried again on the next request
+            if status == 0:
+                self.last_kinit = time.time()
         return self.app(environ, start_response)
 
+class TimingMiddleware(object):
+    """Records how long every request takes, as the "request" span
+
+    The count of that span in /metrics gives the requests per second.
+    """
+    def __init__(self, app):
+        self.app = app
+    def __call__(self, environ, start_response):
+        start = time.time()
+        try:
+            return self.app(environ, start_response)
+        finally:
+            metrics.observe('request', time.time() - start)
+
+def warm_up(app, urls):
+    """Send app a request for each of urls, and throw the answers away
+
+    The first request through a fresh application connects to the
+    database, compiles the Genshi templates and sets up ToscaWidgets.
+    Doing that here, before dispatch.fcgi starts taking connections,
+    keeps it out of the first real request after a worker (re)spawns.
+    """
+    from webob import Request
+    for url in urls:
+        try:
+            Request.blank(url).get_response(app)
+        except Exception:
+            # A page that can't be warmed up is just slower the first time
+            pass
+
 def make_app(global_conf, full_stack=True, **app_conf):
+    start = time.time()
     app = make_base_app(global_conf, full_stack=True, **app_conf)
+    warm_up(app, aslist(app_conf.get('warm_up', '/about')))
+    metrics.observe('startup', time.time() - start)
     app = FastCGIFixMiddleware(app, global_conf)
-    app = KinitMiddleware(app, global_conf)
+    app = KinitMiddleware(app, global_conf, app_conf)
+    app = TimingMiddleware(app)
     return app
-
-
@@ -1,6 +1,6 @@
 """Main Controller"""
 from sipbmp3web.lib.base import BaseController
-from tg import expose, flash, require, url, request, redirect, validate
+from tg import expose, flash, require, url, request, response, redirect, validate
 from pylons.i18n import ugettext as _
 from pylons import config
 #from tg import redirect, validate
@@ -12,26 +12,48 @@ from sipbmp3web.controllers.secure import SecureController
 from remctl import remctl
 import tw.forms as twf
 from sipbmp3web.widgets.slider import UISlider
+from sipbmp3web.lib import metrics, snapshot
+from sipbmp3web.lib.snapshot import json
 
 volume_form = twf.TableForm('volume_form', action='volume', children=[
+    twf.HiddenField('zone'),
     UISlider('volume', min=1, max=31, validator=twf.validators.NotEmpty())
 ])
 
+def zone_remctl(zone, command):
+    """Run a remctl command on the server, against zone if one is given"""
+    server = config['sipbmp3.server']
+    if zone:
+        command = ["zone", zone] + command
+    return remctl(server, command=command)
+
 class RootController(BaseController):
     error = ErrorController()
 
     @expose('sipbmp3web.templates.index')
-    def index(self, **kw):
-        server = config['sipbmp3.server']
+    @metrics.timed('index')
+    def index(self, zone=None, **kw):
         out = dict(page="index")
-        volume = int(remctl(server, command=["volume", "get"]).stdout.rstrip())
-        playing = remctl(server, command=["status", "get"]).stdout
+        volume = int(zone_remctl(zone, ["volume", "get"]).stdout.rstrip())
+        playing = zone_remctl(zone, ["status", "get"]).stdout
         # Todo: add better parsing
         if not playing: playing = "Nothing playing"
+        # The thumbnails themselves are served by gutenbach-art.pl on
+        # the server, which lets browsers cache them indefinitely
+        art = None
+        art_url = config.get('sipbmp3.art_url')
+        if art_url:
+            art = zone_remctl(zone, ["status", "art"]).stdout.strip()
+            if art:
+                art = "%s?art=%s&size=128" % (art_url, art)
         if not "volume" in kw: kw["volume"] = volume
+        kw["zone"] = zone
         return dict(
                     page="index",
+                    zone=zone,
+                    zones=config.get('sipbmp3.zones', '').split(),
                     playing=playing,
+                    art=art,
                     volume=volume,
                     volume_form=volume_form,
                     volume_data=kw,
@@ -39,11 +61,47 @@ class RootController(BaseController):
 
     @validate(form=volume_form, error_handler=index)
     @expose()
-    def volume(self, **kw):
-        server = config['sipbmp3.server']
-        remctl(server, command=["volume", "set", kw["volume"]])
+    @metrics.timed('volume')
+    def volume(self, zone=None, **kw):
+        zone_remctl(zone, ["volume", "set", kw["volume"]])
+        if zone:
+            redirect('index', dict(zone=zone))
         redirect('index')
 
+    @expose(content_type='application/json')
+    @metrics.timed('queue')
+    def queue(self, zone=None, since=None):
+        """The queue, what's playing and the volume, as JSON
+
+        Answers If-None-Match with 304 Not Modified, and with
+        since=VERSION returns only what has changed since VERSION.
+        If the server can't be reached and we have never heard from
+        it, answers 503 Service Unavailable.
+        """
+        def fetch():
+            return (zone_remctl(zone, ["queue", "get"]).stdout,
+                    zone_remctl(zone, ["volume", "get"]).stdout)
+        snap = snapshot.get_snapshot(zone, fetch,
+                                     float(config.get('sipbmp3.queue_refresh', 2)))
+        if snap.data is None:
+            response.status_int = 503
+            response.headers['Retry-After'] = '%d' % max(snap.refresh, 1)
+            return json.dumps(dict(error="The queue is not available right now"))
+        response.headers['ETag'] = snap.etag
+        response.headers['Cache-Control'] = 'no-cache'
+        if_none_match = request.headers.get('If-None-Match', '')
+        if snap.etag in [tag.strip() for tag in if_none_match.split(',')]:
+            response.status_int = 304
+            return ''
+        if since is not None:
+            try:
+                changes = snap.changes_since(int(since))
+            except ValueError:
+                changes = None
+            if changes is not None:
+                return json.dumps(changes)
+        return snap.body
+
     @expose('sipbmp3web.templates.about')
     def about(self):
         return dict(page="about")
@@ -52,3 +110,7 @@ class RootController(BaseController):
     def todo(self):
         return dict(page="todo")
 
+    @expose(content_type='text/plain')
+    def metrics(self):
+        return metrics.render()
+
@@ -0,0 +1,130 @@
+"""In-memory snapshots of the gutenbach queue
+
+However many clients poll the JSON queue API, the server is asked
+for the queue at most once every `refresh` seconds.  The snapshot is
+only rebuilt when what the server sends back has actually changed.
+
+The version comes from the queue daemon on the server, and the ETag
+is a hash of what we send, so every FastCGI worker hands out the same
+ones for the same queue, even across restarts.
+"""
+import time
+import threading
+import logging
+from hashlib import sha1
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+log = logging.getLogger(__name__)
+
+class QueueSnapshot(object):
+    """The latest known state of one zone's queue.
+
+    fetch is called with no arguments and should return a tuple of
+    the raw JSON queue (as printed by 'remctl <server> queue get') and
+    the raw volume (as printed by 'remctl <server> volume get').
+    If that fails, or the server has nothing sensible to say, the last
+    good snapshot is kept; data stays None until there has been one.
+    """
+
+    def __init__(self, fetch, refresh=2, history=100):
+        self.fetch = fetch
+        self.refresh = refresh
+        self.history = history
+        self.version = 0
+        self.data = None
+        self.body = None
+        self.etag = None
+        self._raw = None
+        self._fetched = 0
+        # version -> ids of the jobs in the queue at that version, for
+        # the last `history` versions we have seen, oldest first
+        self._job_ids = {}
+        self._versions = []
+        self._lock = threading.Lock()
+
+    def update(self):
+        """Bring the snapshot up to date if it is older than refresh.
+
+        This holds for failed fetches too, so a server that is down
+        isn't asked any more often than one that is up.
+        """
+        self._lock.acquire()
+        try:
+            now = time.time()
+            if now - self._fetched < self.refresh:
+                return
+            self._fetched = now
+            try:
+                raw = self.fetch()
+                if raw == self._raw:
+                    return
+                self._rebuild(raw)
+            except Exception:
+                log.warning('Could not update the queue, keeping version %d',
+                            self.version, exc_info=True)
+                return
+            self._raw = raw
+        finally:
+            self._lock.release()
+
+    def _rebuild(self, raw):
+        queue, volume = raw
+        data = json.loads(queue)
+        version = int(data['version'])
+        job_ids = [job['id'] for job in data['jobs']]
+        try:
+            data['volume'] = int(volume.split()[0])
+        except (ValueError, IndexError):
+            data['volume'] = None
+        body = json.dumps(data, sort_keys=True)
+        self.version = version
+        self.data = data
+        self.body = body
+        self.etag = '"%s"' % sha1(body.encode('utf-8')).hexdigest()
+        if version not in self._job_ids:
+            self._versions.append(version)
+        self._job_ids[version] = job_ids
+        while len(self._versions) > self.history:
+            del self._job_ids[self._versions.pop(0)]
+
+    def changes_since(self, version):
+        """Return what changed since version, or None if we don't know.
+
+        The result has the jobs that were added (in full), the ids of
+        the jobs that were removed, and the current order, playing
+        job and volume.
+        """
+        old_ids = self._job_ids.get(version)
+        if old_ids is None:
+            return None
+        old_ids = set(old_ids)
+        jobs = self.data['jobs']
+        new_ids = set([job['id'] for job in jobs])
+        return dict(
+            version=self.version,
+            since=version,
+            added=[job for job in jobs if job['id'] not in old_ids],
+            removed=[id for id in old_ids if id not in new_ids],
+            order=[job['id'] for job in jobs],
+            playing=self.data['playing'],
+            volume=self.data['volume'],
+        )
+
+_lock = threading.Lock()
+_snapshots = {}
+
+def get_snapshot(zone, fetch, refresh=2):
+    """Return the shared, up to date, snapshot for zone."""
+    _lock.acquire()
+    try:
+        if zone not in _snapshots:
+            _snapshots[zone] = QueueSnapshot(fetch, refresh)
+        snapshot = _snapshots[zone]
+    finally:
+        _lock.release()
+    snapshot.update()
+    return snapshot
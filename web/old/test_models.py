@@ -37,3 +37,47 @@ class TestUser(TestModel):
         model.DBSession.add(self.member)
         him = model.User.by_email_address(u"ignucius@example.org")
         eq_(him, self.member)
+
+class TestUserPermissions(TestModel):
+    """Test case for User.permissions and the cached permission names."""
+
+    def setUp(self):
+        super(TestUserPermissions, self).setUp()
+        self.member = model.User()
+        self.member.user_name = u"ignucius"
+        self.member.email_address = u"ignucius@example.org"
+        self.group = model.Group()
+        self.group.group_name = u"managers"
+        self.permission = model.Permission()
+        self.permission.permission_name = u"manage"
+        self.permission.groups.append(self.group)
+        model.DBSession.add(self.member)
+        model.DBSession.add(self.group)
+        model.DBSession.add(self.permission)
+        model.DBSession.flush()
+
+    def test_permissions_from_groups(self):
+        """Users should have the permissions of their groups"""
+        self.group.users.append(self.member)
+        eq_(self.member.permissions, set([self.permission]))
+
+    def test_joining_group_invalidates_cache(self):
+        """Joining a group should show up in the cached permissions"""
+        eq_(len(self.member.permissions), 0)
+        self.member.groups.append(self.group)
+        eq_(self.member.permissions, set([self.permission]))
+
+    def test_removing_permission_invalidates_cache(self):
+        """Taking a permission away from a group should show up at once"""
+        self.group.users.append(self.member)
+        eq_(len(self.member.permissions), 1)
+        self.group.permissions.remove(self.permission)
+        eq_(len(self.member.permissions), 0)
+
+    def test_permission_names(self):
+        """The cached permission names follow group changes"""
+        eq_(self.member.permission_names, set())
+        self.group.users.append(self.member)
+        eq_(self.member.permission_names, set([u"manage"]))
+        self.group.permissions.remove(self.permission)
+        eq_(self.member.permission_names, set())
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the queue snapshots behind the JSON queue API"""
+
+from nose.tools import eq_
+
+from sipbmp3web.lib.snapshot import QueueSnapshot, json
+
+
+def queue_json(version, *ids):
+    jobs = [dict(id=id, user=u"ignucius", title=u"track %d" % id) for id in ids]
+    return json.dumps(dict(queue=u"test", version=version,
+                           playing=(jobs[0] if jobs else None), jobs=jobs))
+
+class FakeServer(object):
+    """Stands in for remctl, handing back whatever it was last told to"""
+
+    def __init__(self, queue, volume="20\n"):
+        self.queue = queue
+        self.volume = volume
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if isinstance(self.queue, Exception):
+            raise self.queue
+        return (self.queue, self.volume)
+
+class TestQueueSnapshot(object):
+    """Test case for QueueSnapshot."""
+
+    def setup_method(self, method):
+        self.server = FakeServer(queue_json(7, 1, 2))
+        self.snapshot = QueueSnapshot(self.server, refresh=0, history=3)
+        self.snapshot.update()
+
+    def test_version_from_server(self):
+        """The version is the one the queue daemon wrote"""
+        eq_(self.snapshot.version, 7)
+        eq_(self.snapshot.data['version'], 7)
+        eq_(self.snapshot.data['volume'], 20)
+
+    def test_version_bumps(self):
+        """A new version from the server is picked up"""
+        self.server.queue = queue_json(8, 2)
+        self.snapshot.update()
+        eq_(self.snapshot.version, 8)
+        eq_([job['id'] for job in self.snapshot.data['jobs']], [2])
+
+    def test_etag_is_a_content_hash(self):
+        """Snapshots of the same queue share an ETag, others don't"""
+        other = QueueSnapshot(FakeServer(self.server.queue), refresh=0)
+        other.update()
+        eq_(other.etag, self.snapshot.etag)
+        etag = self.snapshot.etag
+        self.server.volume = "21\n"
+        self.snapshot.update()
+        eq_(self.snapshot.version, 7)
+        assert self.snapshot.etag != etag
+
+    def test_refresh(self):
+        """The server isn't asked again until refresh seconds have passed"""
+        snapshot = QueueSnapshot(self.server, refresh=60)
+        snapshot.update()
+        snapshot.update()
+        eq_(self.server.calls, 2)
+
+    def test_changes_since(self):
+        """changes_since lists the added jobs and the removed ids"""
+        self.server.queue = queue_json(8, 2, 3, 4)
+        self.snapshot.update()
+        changes = self.snapshot.changes_since(7)
+        eq_(changes['version'], 8)
+        eq_(changes['since'], 7)
+        eq_([job['id'] for job in changes['added']], [3, 4])
+        eq_(changes['removed'], [1])
+        eq_(changes['order'], [2, 3, 4])
+        eq_(changes['playing']['id'], 2)
+        eq_(changes['volume'], 20)
+
+    def test_changes_since_unknown(self):
+        """changes_since gives up on versions it has never seen"""
+        eq_(self.snapshot.changes_since(6), None)
+        eq_(self.snapshot.changes_since(8), None)
+
+    def test_history_trimmed(self):
+        """Only the last history versions are remembered"""
+        for version in (8, 9, 10):
+            self.server.queue = queue_json(version, version)
+            self.snapshot.update()
+        eq_(self.snapshot.changes_since(7), None)
+        eq_(self.snapshot.changes_since(8)['removed'], [8])
+
+    def test_failed_fetch_keeps_snapshot(self):
+        """An unreachable server leaves the last snapshot in place"""
+        body = self.snapshot.body
+        self.server.queue = IOError("remctl failed")
+        self.snapshot.update()
+        eq_(self.snapshot.body, body)
+        eq_(self.snapshot.version, 7)
+
+    def test_empty_fetch_keeps_snapshot(self):
+        """An empty answer from the server is not a queue"""
+        self.server.queue = ""
+        self.snapshot.update()
+        eq_(self.snapshot.version, 7)
+        eq_(len(self.snapshot.data['jobs']), 2)
+
+    def test_refresh_while_down(self):
+        """A server that is down isn't asked again until refresh seconds have passed"""
+        server = FakeServer(IOError("remctl failed"))
+        snapshot = QueueSnapshot(server, refresh=60)
+        snapshot.update()
+        snapshot.update()
+        eq_(server.calls, 1)
+        eq_(snapshot.data, None)
+
+    def test_empty_fetch_without_snapshot(self):
+        """With nothing to fall back on, there is no data"""
+        snapshot = QueueSnapshot(FakeServer(""), refresh=0)
+        snapshot.update()
+        eq_(snapshot.data, None)
+        eq_(snapshot.etag, None)